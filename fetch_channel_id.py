@@ -1,28 +1,56 @@
 import os
+import json
 import requests
+from requests.adapters import HTTPAdapter
 
 API_KEY = os.getenv("YOUTUBE_API_KEY")
 SEARCH_URL = "https://www.googleapis.com/youtube/v3/search"
+# ハンドル → channelId のキャッシュ（channelId はほぼ変わらないため、search.list の100ユニットを節約する）
+_HANDLE_CACHE_FILE = ".channel_id_cache.json"
+
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+def load_handle_cache():
+    if os.path.exists(_HANDLE_CACHE_FILE):
+        with open(_HANDLE_CACHE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_handle_cache(cache):
+    with open(_HANDLE_CACHE_FILE, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
 
 
 def get_channel_id_by_handle(handle: str):
-    """@ハンドル（例: @IVEstarship）から channelId を取得する"""
+    """@ハンドル（例: @IVEstarship）から channelId を取得する（結果はファイルにキャッシュする）"""
+    cache = load_handle_cache()
+    if handle in cache:
+        return cache[handle]
+
     params = {
         "part": "snippet",
         "type": "channel",
         "q": handle,
         "key": API_KEY,
         "maxResults": 1,
+        "fields": "items(snippet/channelId)",
     }
 
-    resp = requests.get(SEARCH_URL, params=params, timeout=10)
+    resp = _SESSION.get(SEARCH_URL, params=params, timeout=10)
     resp.raise_for_status()
 
     items = resp.json().get("items", [])
     if not items:
         return None
 
-    return items[0]["snippet"]["channelId"]
+    channel_id = items[0]["snippet"]["channelId"]
+    cache[handle] = channel_id
+    save_handle_cache(cache)
+
+    return channel_id
 
 
 def main():
@@ -1,10 +1,15 @@
 import os
-import json
+import functools
+import re
+import orjson
 import requests
-import isodate
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import time
-from datetime import datetime, timedelta
-from typing import Optional
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import NamedTuple
 
 
 YOUTUBE_API_KEY_ENV = "YOUTUBE_API_KEY"
@@ -15,53 +20,112 @@ MACKEREL_API_KEY_ENV = "MACKEREL_API_KEY"
 MACKEREL_BASE_URL = "https://api.mackerelio.com/api/v0"
 SERVICE_NAME = "kpop-trends"
 
-GROUPS = [
-    {
-        "id": "ive",
-        "name": "IVE",
-        "channel_id": "UCYDmx2Sfpnaxg488yBpZIGg",
-    },
-    {
-        "id": "aespa",
-        "name": "aespa",
-        "channel_id": "UCEf_Bc-KVd7onSeifS3py9g",
-    },
-    {
-        "id": "taeyeon_panorama",
-        "name": "TAEYEON Panorama",
-        "channel_id": "UCEf_Bc-KVd7onSeifS3py9g",
+class Group(NamedTuple):
+    id: str
+    name: str
+    channel_id: str
+    # YouTube 検索の q に使う1語（同じチャンネルのグループと OR でつなぐため、スペースを含めない）
+    search_term: str
+    # タイトル判定用に、グループ名・追加キーワードを小文字化＋スペース除去したもの
+    match_keys: tuple[str, ...]
+
+
+def make_group(group_id: str, name: str, channel_id: str, keywords=(), search_term=None) -> Group:
+    """
+    Group を作る。タイトル判定用の match_keys はここで一度だけ計算する。
+    search_term を省略した場合はグループ名をそのまま使う（1語の名前のみ）。
+    """
+    if search_term is None:
+        search_term = name
+    if " " in search_term:
+        raise ValueError(f"search_term は1語で指定してください: {search_term!r}")
+    keys = (name, *keywords)
+    return Group(group_id, name, channel_id, search_term, tuple(k.lower().replace(" ", "") for k in keys))
+
+
+GROUPS = (
+    make_group("ive", "IVE", "UCYDmx2Sfpnaxg488yBpZIGg"),
+    make_group("aespa", "aespa", "UCEf_Bc-KVd7onSeifS3py9g"),
+    make_group(
+        "taeyeon_panorama",
+        "TAEYEON Panorama",
+        "UCEf_Bc-KVd7onSeifS3py9g",
         # タイトル判定に使うキーワード（スペース除去、小文字化して判定）
-        "keywords": ["taeyeon", "panorama", "태연", "인사"],
-    },
-    {
-        "id": "le_sserafim",
-        "name": "LE SSERAFIM",
-        "channel_id": "UC3IZKseVpdzPSBaWxBxundA",
-    },
-    {
-        "id": "illit",
-        "name": "ILLIT",
-        "channel_id": "UC3IZKseVpdzPSBaWxBxundA",
-    },
-]
+        keywords=("taeyeon", "panorama", "태연", "인사"),
+        search_term="TAEYEON",
+    ),
+    make_group("le_sserafim", "LE SSERAFIM", "UC3IZKseVpdzPSBaWxBxundA", search_term="SSERAFIM"),
+    make_group("illit", "ILLIT", "UC3IZKseVpdzPSBaWxBxundA"),
+)
 
 STATE_FILE = "state.json"
-JST_OFFSET = timedelta(hours=9)
+JST_OFFSET_HOURS = 9
 # YouTube 検索を実行する時刻（JST）
 SEARCH_HOURS_JST = {14, 19}
+# 直近この秒数以内に検索済みのグループは、検索時間帯でも再検索しない。
+# 14時の検索に成功したグループは19時（5時間後）の検索を省略し、
+# 翌日14時（24時間後）・19時→翌14時（19時間後）では cron の遅れがあっても再検索されるよう12時間にする
+SEARCH_MIN_INTERVAL_SEC = 12 * 3600
+# YouTube 検索を並列実行するスレッド数
+SEARCH_MAX_WORKERS = 5
+# 1グループあたりに残すMV候補の数（Shorts だった場合の次点用）
+MV_CANDIDATES_PER_GROUP = 5
+# videos.list の id に指定できる最大件数（超える分は get_videos_stats で分割して取得する）
+VIDEOS_LIST_MAX_IDS = 50
+
+# 一時的なエラー（429 / 5xx / 接続エラー）は指数バックオフでリトライする。
+# 4xx（クォータ超過の 403 など）はリトライしない。
+# Mackerel への POST は同じ name/time の再送なら上書きされるだけなので、POST もリトライ対象にする。
+# raise_on_status=False で、リトライし尽くした後のレスポンスは各関数のエラー処理に渡す。
+# Retry-After の待ち時間にはこの秒数の上限を設ける（毎時の定期実行が次の実行まで詰まらないように）
+RETRY_AFTER_MAX_SEC = 30
+
+
+class _CappedRetry(Retry):
+    """Retry-After ヘッダの待ち時間を RETRY_AFTER_MAX_SEC までに抑える Retry"""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, RETRY_AFTER_MAX_SEC)
+
+
+_RETRY = _CappedRetry(
+    total=5,
+    backoff_factor=0.5,
+    # 同時に失敗した複数スレッドのリトライがそろわないよう、待ち時間をばらつかせる（urllib3 2.x 以降）
+    backoff_jitter=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=["GET", "POST"],
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+
+# googleapis.com / mackerelio.com への接続を使い回すための共有セッション
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=_RETRY))
+
 
 def load_state():
     if os.path.exists(STATE_FILE):
-        with open(STATE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(STATE_FILE, "rb") as f:
+            return orjson.loads(f.read())
     return {}
 
 
 def save_state(state):
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+    """途中で強制終了されても state.json が壊れないよう、一時ファイル経由でアトミックに置き換える"""
+    buf = orjson.dumps(state, option=orjson.OPT_INDENT_2)
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(buf)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, STATE_FILE)
 
 
+@functools.lru_cache(maxsize=1)
 def get_youtube_api_key() -> str:
     """環境変数から API キーを取得する"""
     api_key = os.getenv(YOUTUBE_API_KEY_ENV)
@@ -70,6 +134,7 @@ def get_youtube_api_key() -> str:
     return api_key
 
 
+@functools.lru_cache(maxsize=1)
 def get_mackerel_api_key() -> str:
     api_key = os.getenv(MACKEREL_API_KEY_ENV)
     if not api_key:
@@ -89,7 +154,8 @@ def calc_view_delta(state, group_id, video_id, current_view, title=None):
         "aespa": {
             "video_id": "def456",
             "last_view": 98765,
-            "title": "some title"
+            "title": "some title",
+            "last_search_ts": 1700000000
         }
     }
     """
@@ -117,19 +183,22 @@ def calc_view_delta(state, group_id, video_id, current_view, title=None):
         updated_entry["title"] = title
     elif prev_entry and prev_entry.get("title"):
         updated_entry["title"] = prev_entry["title"]
+    if prev_entry and prev_entry.get("last_search_ts"):
+        updated_entry["last_search_ts"] = prev_entry["last_search_ts"]
 
     state[group_id] = updated_entry
 
     return delta
 
 
-def post_service_metric(metric_name: str, value: float, timestamp: Optional[int] = None):
+def post_service_metrics(points: list):
     """
-    Mackerel のサービスメトリックを1点だけ送る。
+    Mackerel のサービスメトリックをまとめて1回のリクエストで送る。
+    points は {"name", "time", "value"} の dict のリスト。
     https://mackerel.io/ja/api-docs/entry/service-metrics を利用
     """
-    if timestamp is None:
-        timestamp = int(time.time())
+    if not points:
+        return
 
     api_key = get_mackerel_api_key()
 
@@ -137,10 +206,11 @@ def post_service_metric(metric_name: str, value: float, timestamp: Optional[int]
 
     payload = [
         {
-            "name": metric_name,
-            "time": timestamp,
-            "value": float(value),
+            "name": p["name"],
+            "time": p["time"],
+            "value": float(p["value"]),
         }
+        for p in points
     ]
 
     headers = {
@@ -148,114 +218,98 @@ def post_service_metric(metric_name: str, value: float, timestamp: Optional[int]
         "Content-Type": "application/json",
     }
 
-    resp = requests.post(url, headers=headers, json=payload, timeout=10)
+    resp = _SESSION.post(url, headers=headers, data=orjson.dumps(payload), timeout=10)
     resp.raise_for_status()
 
 
-def filter_mv_items(items, group_name: str, extra_keywords=None):
+# 除外すべきキーワード一覧（小文字）。Remix / Performance などの派生版を除く
+EXCLUDE_KEYWORDS = (
+    "remix",
+    "performance",
+    "perf.",
+    "dance",
+    "choreo",
+    "practice",
+    "teaser",
+    "highlight",
+    "lyric",
+    "reaction",
+    "track video",
+)
+# 除外キーワードを1つの正規表現にまとめ、タイトルを1回走査するだけで判定する
+_EXCLUDE_RE = re.compile("|".join(map(re.escape, EXCLUDE_KEYWORDS)))
+# タイトル末尾が "MV" / "MV)" / "MV]" / "Official MV" かどうか
+_MV_END_RE = re.compile(r"mv[\)\]]?\s*$")
+# タイトルからスペースを取り除くための変換テーブル
+_NOSPACE = str.maketrans("", "", " ")
+
+
+def iter_mv_candidates(items, match_keys):
     """
-    正式MV（末尾が MV）かつ、Remix / Performance などの派生版を除外する。
+    正式MV（末尾が MV）かつ、Remix / Performance などの派生版を除外し、
+    条件に合う候補を items の順（新しい順）に1件ずつ返すジェネレータ。
+    match_keys は GROUPS で事前計算した小文字・スペース無しのキーワード。
     """
-    group_key = group_name.lower().replace(" ", "")
-    include_keys = [group_key]
-    if extra_keywords:
-        include_keys.extend([k.lower().replace(" ", "") for k in extra_keywords])
-
-    # 除外すべきキーワード一覧（小文字）
-    exclude_keywords = [
-        "remix",
-        "performance",
-        "perf.",
-        "dance",
-        "choreo",
-        "practice",
-        "teaser",
-        "highlight",
-        "lyric",
-        "reaction",
-        "track video",
-    ]
-
     for item in items:
         title = item["snippet"]["title"]
         title_lower = title.lower()
-        title_compact = title_lower.replace(" ", "")
+        title_compact = title_lower.translate(_NOSPACE)
 
         # グループ名（スペースなし）か追加キーワードのいずれかがタイトルに含まれること
-        if not any(k in title_compact for k in include_keys):
+        if not any(k in title_compact for k in match_keys):
             continue
 
         # 除外キーワードに該当したらスキップ
-        if any(kw in title_lower for kw in exclude_keywords):
+        if _EXCLUDE_RE.search(title_lower):
             continue
 
         # タイトル末尾が "MV"（公式MV）かどうか
-        title_end = title_lower.strip()
-        if not (
-            title_end.endswith("mv")
-            or title_end.endswith("mv)")
-            or title_end.endswith("mv]")
-            or title_end.endswith("official mv")
-        ):
+        if not _MV_END_RE.search(title_lower):
             continue
 
         # ここまで通れば、これは“公式MV”
         video_id = item["id"]["videoId"]
-        return {"video_id": video_id, "title": title}
-
-    return None
+        yield {"video_id": video_id, "title": title}
 
 
-def get_video_duration(video_id: str):
-    """動画の duration（PT3M12S など）を取得する"""
-    api_key = get_youtube_api_key()
-    params = {
-        "key": api_key,
-        "part": "contentDetails",
-        "id": video_id,
-    }
-    resp = requests.get(YOUTUBE_VIDEOS_URL, params=params, timeout=10)
-    resp.raise_for_status()
-    data = resp.json()
-    items = data.get("items", [])
-    if not items:
-        return None
-    return items[0]["contentDetails"]["duration"]
+# YouTube の duration（PT3M12S / P1DT2H など）をパースする正規表現
+_DURATION_RE = re.compile(r"^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
 
 
 def is_shorts(duration: str) -> bool:
     """60秒未満は Shorts と判定する"""
-    try:
-        td = isodate.parse_duration(duration)
-        return td.total_seconds() < 60
-    except Exception:
+    m = _DURATION_RE.match(duration)
+    if not m:
         return False
+    days, hours, minutes, seconds = (int(x or 0) for x in m.groups())
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds < 60
 
 
-def search_latest_mv(channel_id: str, group_name: str, extra_keywords=None):
+def fetch_channel_items(channel_id: str, query: str):
     """
-    指定したチャンネル内で、タイトルに
-      - グループ名（スペース無視）
-      - 'MV'
-    が含まれる動画のみをフィルタし、
-    新しい順に見て最初にヒットしたものを返す。
+    指定したチャンネル内で query にヒットする動画を新しい順に最大50件取得する。
+    同じチャンネルの複数グループをまとめて検索できるよう、query には
+    "aespa|TAEYEON" のように、各グループの search_term（1語）を OR（|）でつないで渡す。
 
-    さらに Shorts（60秒未満）は除外する。
+    MV候補の絞り込みは iter_mv_candidates でグループごとに行い、
+    Shorts（60秒未満）かどうかは、main() でまとめて取得する
+    videos.list の contentDetails.duration で判定する。
     """
     api_key = get_youtube_api_key()
 
-    # まずは「group_name を含む動画」を新しい順で最大50件取得
     params = {
         "key": api_key,
         "part": "snippet",
         "channelId": channel_id,
-        "q": group_name,
+        "q": query,
         "type": "video",
         "order": "date",
         "maxResults": 50,
+        # 使うのはタイトルと videoId だけなので、レスポンスをその2項目に絞る
+        "fields": "items(id/videoId,snippet/title)",
     }
 
-    resp = requests.get(YOUTUBE_SEARCH_URL, params=params, timeout=10)
+    resp = _SESSION.get(YOUTUBE_SEARCH_URL, params=params, timeout=10)
     try:
         resp.raise_for_status()
     except requests.HTTPError:
@@ -288,109 +342,83 @@ def search_latest_mv(channel_id: str, group_name: str, extra_keywords=None):
 
         return None
 
-    data = resp.json()
+    data = orjson.loads(resp.content)
 
-    items = data.get("items", [])
-    if not items:
-        return None
-
-    # グループ名・MV を含む候補をまず絞る
-    mv = filter_mv_items(items, group_name, extra_keywords=extra_keywords)
-    if not mv:
-        return None
-
-    # ここで Shorts 判定を入れる（duration < 60秒 → 除外）
-    video_id = mv["video_id"]
-    duration = get_video_duration(video_id)
-
-    if duration and is_shorts(duration):
-        # Shorts の場合は次点を探す
-        group_lower = group_name.lower().replace(" ", "")
-
-        for item in items[1:]:  # 1件目以外から再探索
-            title = item["snippet"]["title"]
-            title_lower = title.lower()
-            title_compact = title_lower.replace(" ", "")
-            if (group_lower in title_compact or (extra_keywords and any(k in title_compact for k in extra_keywords))) and "mv" in title_lower:
-                vid = item["id"]["videoId"]
-                d2 = get_video_duration(vid)
-                if d2 and not is_shorts(d2):
-                    return {
-                        "video_id": vid,
-                        "title": title,
-                    }
-        return None
-
-    # Shorts でない → 本物のMVとして返す
-    return mv
+    return data.get("items", [])
 
 
-def get_video_stats(video_id: str):
+def get_videos_stats(video_ids):
     """
-    videoId から viewCount などの統計情報を取得する。
+    複数の videoId の統計情報・タイトル・duration を videos.list でまとめて取得する。
+    戻り値は {videoId: {"viewCount", "title", "duration", "raw"}} の dict。
+    （videos.list の id は最大50件までなので、それを超える場合は50件ずつに分けて取得する）
     """
     api_key = get_youtube_api_key()
 
-    params = {
-        "key": api_key,
-        "part": "statistics,snippet",
-        "id": video_id,
-    }
+    stats_map = {}
+    for start in range(0, len(video_ids), VIDEOS_LIST_MAX_IDS):
+        batch = video_ids[start:start + VIDEOS_LIST_MAX_IDS]
 
-    resp = requests.get(YOUTUBE_VIDEOS_URL, params=params, timeout=10)
-    try:
-        resp.raise_for_status()
-    except requests.HTTPError:
-        reason = None
-        message = None
-        body = resp.text
-        try:
-            data_err = resp.json()
-            error_info = data_err.get("error", {})
-            errors = error_info.get("errors", [])
-            if errors:
-                reason = errors[0].get("reason")
-            message = error_info.get("message")
-            body = data_err
-        except Exception:
-            pass
-
-        print(
-            f"[ERROR] YouTube videos.list failed (status={resp.status_code}, reason={reason}, message={message}, body={body})"
-        )
-
-        # クォータ系エラーは他グループも失敗するため知らせる
-        quota_reasons = {
-            "quotaExceeded",
-            "dailyLimitExceeded",
-            "dailyLimitExceededUnreg",
-            "userRateLimitExceeded",
+        params = {
+            "key": api_key,
+            "part": "statistics,contentDetails,snippet",
+            "id": ",".join(batch),
+            "fields": "items(id,statistics/viewCount,snippet/title,contentDetails/duration)",
         }
-        if reason in quota_reasons:
-            return {"quota_exceeded": True}
-
-        return None
-
-    data = resp.json()
-
-    items = data.get("items", [])
-    if not items:
-        return None
 
-    stats = items[0]["statistics"]
-    view_count = int(stats.get("viewCount", 0))
-    snippet = items[0].get("snippet", {})
-
-    return {
-        "viewCount": view_count,
-        "title": snippet.get("title"),
-        "raw": stats,
-    }
+        resp = _SESSION.get(YOUTUBE_VIDEOS_URL, params=params, timeout=10)
+        try:
+            resp.raise_for_status()
+        except requests.HTTPError:
+            reason = None
+            message = None
+            body = resp.text
+            try:
+                data_err = resp.json()
+                error_info = data_err.get("error", {})
+                errors = error_info.get("errors", [])
+                if errors:
+                    reason = errors[0].get("reason")
+                message = error_info.get("message")
+                body = data_err
+            except Exception:
+                pass
+
+            print(
+                f"[ERROR] YouTube videos.list failed (status={resp.status_code}, reason={reason}, message={message}, body={body})"
+            )
+
+            # クォータ系エラーは他グループも失敗するため知らせる
+            quota_reasons = {
+                "quotaExceeded",
+                "dailyLimitExceeded",
+                "dailyLimitExceededUnreg",
+                "userRateLimitExceeded",
+            }
+            if reason in quota_reasons:
+                return {"quota_exceeded": True}
+
+            return None
+
+        data = orjson.loads(resp.content)
+
+        for item in data.get("items", []):
+            stats = item["statistics"]
+            snippet = item.get("snippet", {})
+            stats_map[item["id"]] = {
+                "viewCount": int(stats.get("viewCount", 0)),
+                "title": snippet.get("title"),
+                "duration": item.get("contentDetails", {}).get("duration"),
+                "raw": stats,
+            }
+
+    return stats_map
 
 
 def main():
-    # JST 現在時刻を取得
-    current_hour_jst = (datetime.utcnow() + JST_OFFSET).hour
+    # 全メトリクスで同じタイムスタンプを使い、JST の時刻もここから求める
+    timestamp = int(time.time())
+    current_hour_jst = (timestamp // 3600 + JST_OFFSET_HOURS) % 24
     should_search = current_hour_jst in SEARCH_HOURS_JST
 
     if should_search:
@@ -401,35 +429,118 @@ def main():
     # ここで前回のstate.jsonを読み込む
     state = load_state()
 
+    # 1. YouTube 検索はチャンネル単位で1回だけ行い、チャンネル同士は並列に実行する
+    #    （state の参照・更新はスレッドの外でのみ行う）
+    #    直近に検索済みのグループは search.list（100ユニット）を使わずキャッシュで済ませる
+    search_results = {}
+    if should_search:
+        channels_to_groups = defaultdict(list)
+        for g in GROUPS:
+            if timestamp - state.get(g.id, {}).get("last_search_ts", 0) >= SEARCH_MIN_INTERVAL_SEC:
+                channels_to_groups[g.channel_id].append(g)
+
+        # 各グループの search_term は1語なので、"aespa|TAEYEON" のようにそのまま OR でつなげる。
+        # なお、新しい順50件の検索結果は同じチャンネルのグループ間で共有されるため、
+        # 投稿の多いレーベルチャンネル（SMTOWN / HYBE LABELS）では、一方のグループの投稿で
+        # もう一方のMVが50件の範囲から押し出されることがある（その場合はキャッシュ済みMVを使う）
+        with ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS) as ex:
+            results = ex.map(
+                lambda entry: fetch_channel_items(entry[0], "|".join(g.search_term for g in entry[1])),
+                channels_to_groups.items(),
+            )
+            channel_items = dict(zip(channels_to_groups, results))
+
+        # 同じ検索結果から、グループごとにMV候補を絞り込む
+        for channel_id, groups in channels_to_groups.items():
+            items = channel_items[channel_id]
+            for g in groups:
+                if items is None or isinstance(items, dict):
+                    # 検索失敗・クォータ超過はそのままグループに伝える
+                    search_results[g.id] = items
+                else:
+                    search_results[g.id] = list(
+                        islice(iter_mv_candidates(items, g.match_keys), MV_CANDIDATES_PER_GROUP)
+                    )
+
+    # 2. 各グループのMV候補を決める（検索結果 + キャッシュ）
+    targets = []
     for g in GROUPS:
-        group_id = g["id"]
-        group_name = g["name"]
-        channel_id = g["channel_id"]
+        group_id = g.id
+        group_name = g.name
 
         print("=" * 60)
         print(f"[{group_id}] グループ: {group_name}")
 
-        latest = None
+        candidates = []
         cached_entry = state.get(group_id)
 
-        if should_search:
-            latest = search_latest_mv(channel_id, group_name, extra_keywords=g.get("keywords"))
+        if should_search and group_id not in search_results:
+            print(f"[{group_id}] 直近に検索済みのため、キャッシュ済みMVを使用します。")
+        elif should_search:
+            latest = search_results[group_id]
             if isinstance(latest, dict) and latest.get("quota_exceeded"):
                 print(f"[{group_id}] YouTube API のクォータに到達したため、残りのグループ処理を中断します。")
                 break
-            if latest is None:
+            if latest:
+                candidates.extend(latest)
+                print(f"[{group_id}] MV候補が {len(latest)} 件見つかりました。")
+            else:
                 print(f"[{group_id}] MV らしき動画が見つかりませんでした。キャッシュがあればそれを使います。")
 
-        if latest is None:
-            if not cached_entry:
-                print(f"[{group_id}] 検索を行わず、キャッシュも無いためスキップします。次の検索時間帯に更新されます。")
+        # 検索結果が全て Shorts だった場合にも備えて、キャッシュ済みMVを最後の候補にする
+        if cached_entry:
+            candidates.append({
+                "video_id": cached_entry["video_id"],
+                "title": cached_entry.get("title", "(タイトル不明)"),
+                "from_cache": True,
+            })
+
+        if not candidates:
+            print(f"[{group_id}] 検索を行わず、キャッシュも無いためスキップします。次の検索時間帯に更新されます。")
+            continue
+
+        targets.append({"group_id": group_id, "candidates": candidates})
+
+    # 3. 全グループの候補の統計情報・duration を videos.list 1回でまとめて取得
+    stats_map = {}
+    if targets:
+        # 同じ動画を複数グループで参照する場合もあるため、順序を保って重複を除く
+        video_ids = list(dict.fromkeys(c["video_id"] for t in targets for c in t["candidates"]))
+        stats_map = get_videos_stats(video_ids)
+        print("=" * 60)
+        if stats_map is None:
+            print("統計情報の取得に失敗しました。")
+            stats_map = {}
+        elif stats_map.get("quota_exceeded"):
+            print("YouTube API のクォータに到達したため、残りのグループ処理を中断します。")
+            stats_map = {}
+
+    # 4. グループごとに Shorts でない最初の候補を採用し、メトリクスを組み立てる
+    points = []
+    for t in targets:
+        group_id = t["group_id"]
+
+        chosen = None
+        stats = None
+        for cand in t["candidates"]:
+            stats = stats_map.get(cand["video_id"])
+            if not stats:
+                continue
+            duration = stats.get("duration")
+            if duration and is_shorts(duration):
+                print(f"[{group_id}] Shorts のため除外します: {cand['title']}")
                 continue
-            video_id = cached_entry["video_id"]
-            title = cached_entry.get("title", "(タイトル不明)")
+            chosen = cand
+            break
+
+        if chosen is None:
+            print(f"[{group_id}] 統計情報の取得に失敗したか、Shorts 以外のMVがありませんでした。")
+            continue
+
+        video_id = chosen["video_id"]
+        title = chosen["title"]
+        if chosen.get("from_cache"):
             print(f"[{group_id}] キャッシュ済みのMVを使用します。")
-        else:
-            video_id = latest["video_id"]
-            title = latest["title"]
 
         url = f"https://www.youtube.com/watch?v={video_id}"
 
@@ -438,14 +549,6 @@ def main():
         print("  videoId :", video_id)
         print("  URL     :", url)
 
-        stats = get_video_stats(video_id)
-        if not stats:
-            print(f"[{group_id}] 統計情報の取得に失敗しました。")
-            continue
-        if stats.get("quota_exceeded"):
-            print(f"[{group_id}] YouTube API のクォータに到達したため、残りのグループ処理を中断します。")
-            break
-
         # タイトルがキャッシュに無い場合、動画情報から補完する
         if title == "(タイトル不明)" and stats.get("title"):
             title = stats["title"]
@@ -455,14 +558,25 @@ def main():
 
         # 絶対値メトリック
         metric_abs = f"kpop.youtube.viewcount.{group_id}_{video_id}"
-        post_service_metric(metric_abs, view_count)
-        print(f"[{group_id}] 絶対値メトリック投稿完了 ({metric_abs})")
+        points.append({"name": metric_abs, "time": timestamp, "value": view_count})
+        print(f"[{group_id}] 絶対値メトリック ({metric_abs})")
 
         # 差分メトリック
         delta = calc_view_delta(state, group_id, video_id, view_count, title=title)
         metric_delta = f"kpop.youtube.viewdelta.{group_id}_{video_id}"
-        post_service_metric(metric_delta, delta)
-        print(f"[{group_id}] 差分メトリック投稿完了 ({metric_delta}): {delta}")
+        points.append({"name": metric_delta, "time": timestamp, "value": delta})
+        print(f"[{group_id}] 差分メトリック ({metric_delta}): {delta}")
+
+        # 検索結果の候補を採用したときだけ最終検索時刻を記録する
+        # （統計取得に失敗した・キャッシュに戻った場合は、次の実行で再検索させる）
+        if not chosen.get("from_cache"):
+            state[group_id]["last_search_ts"] = timestamp
+
+    # 5. Mackerel へ1回のリクエストでまとめて投稿
+    if points:
+        post_service_metrics(points)
+        print("=" * 60)
+        print(f"Mackerel へ {len(points)} 件のメトリクスを投稿しました。")
 
     # ここで state.json を保存
     save_state(state)